@@ -3,18 +3,26 @@
 import dataclasses
 import datetime
 import logging
-from collections import defaultdict
-from collections.abc import Iterable
-from typing import Optional
+import sys
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
 from urllib.parse import urljoin
 
-import backoff
+import numpy as np
+import numpy.typing as npt
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+try:
+    import orjson as json
+except ImportError:
+    import json  # type: ignore[no-redef]
 
 logger = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass(frozen=True, eq=True)
+@dataclasses.dataclass(frozen=True, eq=True, slots=True)
 class ExchangeRate:
     date: datetime.date
     base_currency: str
@@ -51,14 +59,85 @@ class ExchangeRate:
             exchange_rate=1 / lookup_rate.exchange_rate * self.exchange_rate,
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        """Returns the rate as a dictionary, a shallow and faster dataclasses.asdict"""
+        return {
+            "date": self.date,
+            "base_currency": self.base_currency,
+            "target_currency": self.target_currency,
+            "exchange_rate": self.exchange_rate,
+        }
+
     def __repr__(self) -> str:
         return f"<{self.base_currency} => {self.target_currency} @{self.date.strftime('%Y-%m-%d')} ({self.exchange_rate})>"
 
 
+@dataclasses.dataclass(frozen=True, eq=False)
+class RateSeries:
+    """Rates of a single currency pair stored as parallel arrays of dates and rates,
+    observed tells the rates published by ECB from those filled in"""
+
+    base_currency: str
+    target_currency: str
+    dates: npt.NDArray[np.datetime64]
+    rates: npt.NDArray[np.float64]
+    observed: npt.NDArray[np.bool_]
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, key: npt.NDArray[np.bool_]) -> "RateSeries":
+        return dataclasses.replace(
+            self,
+            dates=self.dates[key],
+            rates=self.rates[key],
+            observed=self.observed[key],
+        )
+
+    def last_observed(self) -> Optional[ExchangeRate]:
+        """Returns the last rate published by ECB, if any"""
+        if not self.observed.any():
+            return None
+        index = np.flatnonzero(self.observed)[-1]
+        return ExchangeRate(
+            date=self.dates[index].item(),
+            base_currency=self.base_currency,
+            target_currency=self.target_currency,
+            exchange_rate=float(self.rates[index]),
+        )
+
+
 class ECBClient:
-    def __init__(self) -> None:
+    def __init__(self, cache_path: Optional[str] = None) -> None:
         self.base_url = "https://data-api.ecb.europa.eu/service/data/EXR/"
-        self.session = requests.Session()
+        self.cache_path = cache_path
+        self.session = self._session()
+        # Throttled and failed requests are retried by urllib3, honouring Retry-After,
+        # the last response is returned when the retries run out
+        retry = Retry(
+            total=4,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # Currencies are downloaded concurrently, keep a connection for each worker
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=16, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+
+    def _session(self) -> requests.Session:
+        if self.cache_path is None:
+            return requests.Session()
+        try:
+            import requests_cache
+        except ImportError as error:
+            raise ImportError(
+                "Caching responses requires requests-cache, install the 'cache' extra"
+            ) from error
+        # Nothing is cached unless a request says otherwise, see get_exchange_rates
+        return requests_cache.CachedSession(
+            self.cache_path, backend="sqlite", expire_after=requests_cache.DO_NOT_CACHE
+        )
 
     def _resource(self, target_currency: str, granularity: str = "D") -> str:
         # As explained in the docs, it is used to uniquely identify exchange rates.
@@ -73,60 +152,102 @@ class ECBClient:
         return resource
 
     def _fill_missing_dates(
-        self, data: list[ExchangeRate], end_date: Optional[datetime.date] = None
-    ) -> list[ExchangeRate]:
-        """Fill missing conversions with the last known, typically during weekends and holidays"""
+        self,
+        data: RateSeries,
+        end_date: Optional[datetime.date] = None,
+        last_rate: Optional[ExchangeRate] = None,
+    ) -> RateSeries:
+        """Fill missing conversions with the last known, typically during weekends and holidays,
+        last_rate is the last known conversion preceding the data, if any"""
 
         end_date = end_date or datetime.date.today()
 
-        all_dates = {entry.date: entry for entry in data}
-        complete_data: list[ExchangeRate] = []
-        current_date = min(all_dates)
-        last_conversion = None
+        if last_rate is not None:
+            data = RateSeries(
+                base_currency=data.base_currency,
+                target_currency=data.target_currency,
+                dates=np.concatenate(
+                    [np.array([last_rate.date], dtype="datetime64[D]"), data.dates]
+                ),
+                rates=np.concatenate([[last_rate.exchange_rate], data.rates]),
+                observed=np.concatenate([[True], data.observed]),
+            )
 
-        while current_date <= end_date:
-            if current_date in all_dates:
-                last_conversion = all_dates[current_date]
+        in_range = data.dates <= np.datetime64(end_date, "D")
+        if not in_range.any():
+            logger.warning(
+                f"Missing exchange rates for {data.target_currency} until {end_date} "
+                "with no usable history, try using older start period"
+            )
+            return data[in_range]
 
-            if last_conversion is None:
-                logger.warning(
-                    f"Missing exchange rates for {current_date} with no usable history, try using older start period"
-                )
-            else:
-                complete_data.append(
-                    ExchangeRate(
-                        date=current_date,
-                        base_currency=last_conversion.base_currency,
-                        target_currency=last_conversion.target_currency,
-                        exchange_rate=last_conversion.exchange_rate,
-                    )
-                )
+        start = data.dates[in_range].min()
+        all_dates = np.arange(
+            start, np.datetime64(end_date, "D") + 1, dtype="datetime64[D]"
+        )
+        positions = (data.dates[in_range] - start).astype(np.intp)
+        rates = np.full(len(all_dates), np.nan)
+        rates[positions] = data.rates[in_range]
+        observed = np.zeros(len(all_dates), dtype=np.bool_)
+        observed[positions] = data.observed[in_range]
 
-            current_date += datetime.timedelta(days=1)
+        # Forward fill, index of the last known rate for each day
+        last_known = np.where(~np.isnan(rates), np.arange(len(rates)), 0)
+        np.maximum.accumulate(last_known, out=last_known)
 
-        return complete_data
+        return RateSeries(
+            base_currency=data.base_currency,
+            target_currency=data.target_currency,
+            dates=all_dates,
+            rates=rates[last_known],
+            observed=observed,
+        )
 
-    @backoff.on_exception(backoff.expo, requests.HTTPError, max_tries=5, max_time=60)
-    def get_exchange_rates(
+    def _download_exchange_rates(
         self,
         target_currency: str,
         start_date: datetime.date,
-        end_date: Optional[datetime.date] = None,
-    ) -> list[ExchangeRate]:
-        end_date = end_date or datetime.date.today()
+        end_date: datetime.date,
+        allow_empty: bool = False,
+    ) -> RateSeries:
+        empty = RateSeries(
+            base_currency="EUR",
+            target_currency=sys.intern(target_currency),
+            dates=np.empty(0, dtype="datetime64[D]"),
+            rates=np.empty(0, dtype=np.float64),
+            observed=np.empty(0, dtype=np.bool_),
+        )
+        if start_date > end_date:
+            return empty
+
         resource = self._resource(target_currency)
         url = urljoin(self.base_url, resource)
 
+        request_kwargs: dict[str, Any] = {}
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        if self.cache_path and end_date < yesterday:
+            import requests_cache
+
+            # Published rates never change, ranges that already ended are cached for good
+            request_kwargs["expire_after"] = requests_cache.NEVER_EXPIRE
+
         response = self.session.get(
             url,
             params={
-                "startPeriod": start_date.strftime("%Y-%m-%d"),
-                "endPeriod": end_date.strftime("%Y-%m-%d"),
+                "startPeriod": start_date.isoformat(),
+                "endPeriod": end_date.isoformat(),
                 "detail": "dataonly",
                 "includeHistory": "false",
                 "format": "jsondata",
             },
+            **request_kwargs,
         )
+        if response.status_code == 404 and allow_empty:
+            # ECB responds with not found when there are no rates in the period
+            logger.info(
+                f"No {target_currency} exchange rates between {start_date} and {end_date}"
+            )
+            return empty
         try:
             response.raise_for_status()
         except requests.HTTPError as error:
@@ -134,77 +255,156 @@ class ECBClient:
                 raise
             logger.error(response.text)
             raise ValueError(f"Bad status code: {response.status_code}") from error
-        content = response.json()
-        dates = (
-            date["id"]
-            for date in content["structure"]["dimensions"]["observation"][0]["values"]
-        )
-        rates = (
-            rate[0]
-            for rate in content["dataSets"][0]["series"]["0:0:0:0:0"][
-                "observations"
-            ].values()
-        )
-        return self._fill_missing_dates(
-            [
-                ExchangeRate(
-                    date=datetime.datetime.strptime(key, "%Y-%m-%d").date(),
-                    base_currency="EUR",
-                    target_currency=target_currency,
-                    exchange_rate=value,
-                )
-                for key, value in dict(zip(dates, rates)).items()
-            ],
-            end_date=end_date,
+        content = json.loads(response.content)
+        dates = content["structure"]["dimensions"]["observation"][0]["values"]
+        rates = content["dataSets"][0]["series"]["0:0:0:0:0"]["observations"]
+        count = min(len(dates), len(rates))
+        return dataclasses.replace(
+            empty,
+            dates=np.fromiter(
+                (date["id"] for date in dates), dtype="datetime64[D]", count=count
+            ),
+            rates=np.fromiter(
+                (rate[0] for rate in rates.values()), dtype=np.float64, count=count
+            ),
+            observed=np.ones(count, dtype=np.bool_),
+        )
+
+    def get_exchange_rates(
+        self,
+        target_currency: str,
+        start_date: datetime.date,
+        end_date: Optional[datetime.date] = None,
+        last_rate: Optional[ExchangeRate] = None,
+    ) -> RateSeries:
+        """Returns daily rates from start_date, when resuming pass the last known
+        rate before start_date as last_rate, there may be no newer rates yet"""
+        end_date = end_date or datetime.date.today()
+        # The decoded payload is released on return, only the arrays are kept
+        data = self._download_exchange_rates(
+            target_currency, start_date, end_date, allow_empty=last_rate is not None
         )
+        return self._fill_missing_dates(data, end_date=end_date, last_rate=last_rate)
 
 
 class RateCalculator:
     def __init__(
         self,
-        rates: list[ExchangeRate],
+        rates: Iterable[RateSeries],
         base_currency: str = "EUR",
     ) -> None:
-        self.rates = rates.copy()
-        self.base_currency = base_currency
-        for rate in self.rates:
-            if rate.base_currency == self.base_currency:
-                self.rates.append(rate.invert())
+        self.base_currency = sys.intern(base_currency)
+        # Every emitted rate shares these interned codes, referenced by column
+        self._currency_index: dict[str, int] = {self.base_currency: 0}
+
+        series = list(rates)
+        for entry in series:
+            if entry.base_currency != base_currency:
+                raise ValueError(
+                    f"Cannot calculate rates from {entry.target_currency} "
+                    f"based on {entry.base_currency}, expected {base_currency}"
+                )
+            self._currency_index.setdefault(
+                sys.intern(entry.target_currency), len(self._currency_index)
+            )
+        self._currencies = list(self._currency_index)
+
+        # Structure of arrays, one entry per known rate
+        dates = np.concatenate(
+            [np.empty(0, dtype="datetime64[D]"), *(entry.dates for entry in series)]
+        )
+        target_idx = np.repeat(
+            np.array(
+                [self._currency_index[entry.target_currency] for entry in series],
+                dtype=np.intp,
+            ),
+            np.array([len(entry) for entry in series], dtype=np.intp),
+        )
+        rate_values = np.concatenate(
+            [np.empty(0, dtype=np.float64), *(entry.rates for entry in series)]
+        )
 
-        self.by_date: dict[datetime.date, list[ExchangeRate]] = defaultdict(list)
+        # One row per date, one column per currency with base => currency rates, NaN where missing,
+        # np.unique sorts the dates once and maps every rate to its row in C
+        self.dates, date_idx = np.unique(dates, return_inverse=True)
+        self.rates_matrix = np.full((len(self.dates), len(self._currencies)), np.nan)
+        self.rates_matrix[:, 0] = 1.0
+        self.rates_matrix[date_idx, target_idx] = rate_values
 
-        for rate in self.rates:
-            self.by_date[rate.date].append(rate)
+        # Lookups independent of the new base, built once for all calculations
+        self._missing = np.isnan(self.rates_matrix)
+        # currency => base rates, rebasing is then a multiplication only
+        with np.errstate(divide="ignore"):
+            self.inverse_matrix = np.reciprocal(self.rates_matrix)
+        self._date_objects: list[datetime.date] = self.dates.astype(object).tolist()
 
     def calculate_rebased_rates(self, currencies: Iterable[str]) -> list[ExchangeRate]:
-        exchange_rates: list[ExchangeRate] = self.rates.copy()
-        for date, rates in self.by_date.items():
-            base_rates = {
-                rate.target_currency: rate
-                for rate in rates
-                if self.base_currency == rate.base_currency
-            }
-            for new_base in currencies:
-                if new_base == self.base_currency:
-                    logger.debug(f"Skipping {new_base} => it is already a base")
-                    continue
-                logger.debug(f"Converting rates for {date} into {new_base}")
-                for rate in rates:
-                    if rate.base_currency != self.base_currency:
-                        logger.debug(f"Skipping {rate} => already rebased as inversion")
-                        continue
-                    if rate.target_currency == new_base:
-                        logger.debug(
-                            f"Skipping {rate} => it is inverted and will be processed in a different batch"
-                        )
-                        continue
-                    try:
-                        lookup_rate = base_rates[new_base]
-                    except KeyError:
-                        logger.warning(
-                            f"No lookup rate was found for {new_base} on {date}, cannot create conversion"
-                        )
-                        continue
-                    logger.debug(f"Rebasing {rate} for {new_base} using {lookup_rate}")
-                    exchange_rates.append(rate.rebase(new_base, lookup_rate))
-        return exchange_rates
+        return list(self.iter_rebased(currencies))
+
+    def iter_rebased(
+        self, currencies: Iterable[str], chunk_size: int = 1024
+    ) -> Iterator[ExchangeRate]:
+        """Yield the original, inverted and rebased rates, calculated for chunk_size
+        dates at a time so the rates for all dates are never held at once"""
+        base_columns: list[int] = [0]
+        for new_base in dict.fromkeys(currencies):
+            if new_base == self.base_currency:
+                logger.debug(f"Skipping {new_base} => it is already a base")
+                continue
+            try:
+                column = self._currency_index[new_base]
+            except KeyError:
+                logger.warning(
+                    f"No lookup rate was found for {new_base}, cannot create conversion"
+                )
+                continue
+            for date in self.dates[self._missing[:, column]]:
+                logger.warning(
+                    f"No lookup rate was found for {new_base} on {date}, cannot create conversion"
+                )
+            base_columns.append(column)
+
+        columns = np.array(base_columns, dtype=np.intp)
+        # Currencies not rebased onto still get their rates inverted
+        inverted_columns = np.setdiff1d(
+            np.arange(1, len(self._currencies), dtype=np.intp), columns
+        )
+        for start in range(0, len(self.dates), chunk_size):
+            rates = self.rates_matrix[start : start + chunk_size]
+            inverse = self.inverse_matrix[start : start + chunk_size]
+            # cross[d, b, t] is the rate of currency t based on column b
+            with np.errstate(invalid="ignore"):
+                cross = rates[:, None, :] * inverse[:, columns, None]
+            mask = np.isfinite(cross)
+            mask[:, np.arange(len(columns)), columns] = False
+            date_pos, base_pos, target_pos = np.nonzero(mask)
+
+            for d, b, t, value in zip(
+                date_pos.tolist(),
+                base_pos.tolist(),
+                target_pos.tolist(),
+                cross[mask].tolist(),
+                strict=True,
+            ):
+                yield ExchangeRate(
+                    date=self._date_objects[start + d],
+                    base_currency=self._currencies[base_columns[b]],
+                    target_currency=self._currencies[t],
+                    exchange_rate=value,
+                )
+
+            inverted = inverse[:, inverted_columns]
+            mask = np.isfinite(inverted)
+            date_pos, column_pos = np.nonzero(mask)
+            for d, c, value in zip(
+                date_pos.tolist(),
+                inverted_columns[column_pos].tolist(),
+                inverted[mask].tolist(),
+                strict=True,
+            ):
+                yield ExchangeRate(
+                    date=self._date_objects[start + d],
+                    base_currency=self._currencies[c],
+                    target_currency=self.base_currency,
+                    exchange_rate=value,
+                )
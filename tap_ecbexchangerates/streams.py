@@ -2,14 +2,22 @@
 
 import datetime
 import logging
+import sys
 from collections.abc import Iterable
-from dataclasses import asdict
-from typing import Any, ClassVar, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, ClassVar, Dict, Optional
 
+import numpy as np
 from singer_sdk import typing as th  # JSON Schema typing helpers
+from singer_sdk._singerlib.messages import format_message
 from singer_sdk.streams import Stream
 
-from tap_ecbexchangerates.client import ECBClient, ExchangeRate, RateCalculator
+from tap_ecbexchangerates.client import (
+    ECBClient,
+    ExchangeRate,
+    RateCalculator,
+    RateSeries,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -40,41 +48,122 @@ class ExchangeRatesStream(Stream):
         ),
     ).to_dict()
 
+    # Number of RECORD messages buffered before they are written to stdout at once
+    record_batch_size = 10_000
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._record_buffer: list[str] = []
+
+    def _write_record_message(self, record: Dict[str, Any]) -> None:
+        """Buffer RECORD messages instead of writing and flushing each one"""
+        for record_message in self._generate_record_messages(record):
+            self._record_buffer.append(format_message(record_message))
+        if len(self._record_buffer) >= self.record_batch_size:
+            self._flush_record_messages()
+
+        self._is_state_flushed = False
+
+    def _write_state_message(self) -> None:
+        """Write buffered records first, state must follow the records it covers"""
+        self._flush_record_messages()
+        super()._write_state_message()
+
+    def _flush_record_messages(self) -> None:
+        if not self._record_buffer:
+            return
+        self._record_buffer.append("")
+        sys.stdout.write("\n".join(self._record_buffer))
+        sys.stdout.flush()
+        self._record_buffer.clear()
+
     def get_records(
         self, context: Optional[Dict[str, Any]]
-    ) -> Iterable[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+    ) -> Iterable[Dict[str, Any]]:
         state = self.get_context_state(context)
         previous_end_date = state.get("end_date")
+        last_rates: dict[str, dict[str, Any]] = state.get("last_rates", {})
+        currencies: list[str] = self.config["currencies"]
         start_date: datetime.date
         end_date: datetime.date
+        seeds: dict[str, ExchangeRate] = {}
+        start_dates: dict[str, datetime.date] = {}
+        emit_from: Optional[datetime.date] = None
 
-        if previous_end_date:
+        if previous_end_date and all(currency in last_rates for currency in currencies):
+            seeds = {
+                currency: ExchangeRate(
+                    date=datetime.date.fromisoformat(last_rates[currency]["date"]),
+                    base_currency="EUR",
+                    target_currency=currency,
+                    exchange_rate=last_rates[currency]["rate"],
+                )
+                for currency in currencies
+            }
+            # Days after the last published rate were filled in and may have been published
+            # since, a currency ECB stopped publishing must not hold the window back forever
+            emit_from = max(
+                min(seed.date for seed in seeds.values()) + datetime.timedelta(days=1),
+                datetime.date.fromisoformat(previous_end_date)
+                - datetime.timedelta(days=7),
+            )
+            for currency, seed in seeds.items():
+                if seed.date < emit_from:
+                    start_dates[currency] = seed.date + datetime.timedelta(days=1)
+                else:
+                    # The rate in force when the window starts has to be downloaded again
+                    start_dates[currency] = emit_from - datetime.timedelta(days=7)
+            logger.info(
+                f"Resuming download using {previous_end_date=}, "
+                f"emitting rates from {emit_from}"
+            )
+        elif previous_end_date:
             logger.info(f"Resuming download using {previous_end_date=}")
-            start_date = datetime.datetime.strptime(
-                previous_end_date, "%Y-%m-%d"
-            ).date() - datetime.timedelta(days=7)
+            start_date = datetime.date.fromisoformat(
+                previous_end_date
+            ) - datetime.timedelta(days=7)
             logger.info(
                 f"New start date: {start_date} to cover missing weekend and holiday data"
             )
         else:
-            start_date = datetime.datetime.strptime(
-                self.config.get("start_date", "2000-01-01"), "%Y-%m-%d"
-            ).date()
+            start_date = datetime.date.fromisoformat(
+                self.config.get("start_date", "2000-01-01")
+            )
+        if not start_dates:
+            start_dates = dict.fromkeys(currencies, start_date)
         end_date_str = self.config.get("end_date")
         end_date = (
-            datetime.datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            datetime.date.fromisoformat(end_date_str)
             if end_date_str
             else datetime.date.today()
         )
-        client = ECBClient()
-        rates: list[ExchangeRate] = []
-        for currency in self.config["currencies"]:
-            rates.extend(
-                client.get_exchange_rates(
-                    currency, start_date=start_date, end_date=end_date
+        client = ECBClient(cache_path=self.config.get("http_cache"))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            rates: list[RateSeries] = list(
+                executor.map(
+                    lambda currency: client.get_exchange_rates(
+                        currency,
+                        start_date=start_dates[currency],
+                        end_date=end_date,
+                        last_rate=seeds.get(currency),
+                    ),
+                    currencies,
                 )
             )
-        state["end_date"] = end_date.strftime("%Y-%m-%d")
+        for series in rates:
+            last_rate = series.last_observed()
+            if last_rate is not None:
+                last_rates[series.target_currency] = {
+                    "date": last_rate.date.isoformat(),
+                    "rate": last_rate.exchange_rate,
+                }
+        if emit_from is not None:
+            # Earlier rates were emitted by the previous runs already
+            rates = [
+                series[series.dates >= np.datetime64(emit_from)] for series in rates
+            ]
+        state["end_date"] = end_date.isoformat()
+        state["last_rates"] = last_rates
         calculator = RateCalculator(rates)
-        all_rates = calculator.calculate_rebased_rates(self.config["currencies"])
-        yield from map(asdict, all_rates)
+        del rates  # copied into the calculator, no need to keep them while emitting
+        yield from (rate.to_dict() for rate in calculator.iter_rebased(currencies))
@@ -32,6 +32,11 @@ class TapECBEchangeRates(Tap):
             th.DateType,
             description="End date (defaults to today)",
         ),
+        th.Property(
+            "http_cache",
+            th.StringType,
+            description="Path of a SQLite file to cache responses of past date ranges in (requires the 'cache' extra)",
+        ),
     ).to_dict()
 
     def discover_streams(self) -> list[Any]:
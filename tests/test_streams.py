@@ -0,0 +1,159 @@
+"""Tests resuming the exchange rates stream from state."""
+
+import datetime
+import json
+from typing import Any
+
+import pytest
+import requests
+
+from tap_ecbexchangerates.streams import ExchangeRatesStream
+from tap_ecbexchangerates.tap import TapECBEchangeRates
+
+# Daily rates published by the fake ECB API, USD stops on Friday 2024-03-01
+WEEKDAYS = [
+    datetime.date(2024, 2, 26) + datetime.timedelta(days=i)
+    for i in range(19)
+    if (datetime.date(2024, 2, 26) + datetime.timedelta(days=i)).weekday() < 5
+]
+PUBLISHED = {
+    "USD": {date: 1.1 + i / 100 for i, date in enumerate(WEEKDAYS[:5])},
+    "CZK": {date: 25.0 + i for i, date in enumerate(WEEKDAYS)},
+}
+
+
+def _response(url: str, status_code: int, content: Any = None) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = (
+        json.dumps(content).encode() if content else b"No results found."
+    )
+    return response
+
+
+@pytest.fixture
+def requests_made(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, str, str]]:
+    """Replace the ECB API with PUBLISHED, returns the (currency, start, end) requested"""
+    requests_made: list[tuple[str, str, str]] = []
+
+    def get(
+        self: requests.Session, url: str, params: dict[str, str], **kwargs: Any
+    ) -> requests.Response:
+        currency = url.rsplit("/", 1)[1].split(".")[1]
+        start, end = params["startPeriod"], params["endPeriod"]
+        requests_made.append((currency, start, end))
+        dates = sorted(
+            date for date in PUBLISHED[currency] if start <= date.isoformat() <= end
+        )
+        if not dates:
+            return _response(url, 404)
+        return _response(
+            url,
+            200,
+            {
+                "structure": {
+                    "dimensions": {
+                        "observation": [
+                            {"values": [{"id": date.isoformat()} for date in dates]}
+                        ]
+                    }
+                },
+                "dataSets": [
+                    {
+                        "series": {
+                            "0:0:0:0:0": {
+                                "observations": {
+                                    str(i): [PUBLISHED[currency][date]]
+                                    for i, date in enumerate(dates)
+                                }
+                            }
+                        }
+                    }
+                ],
+            },
+        )
+
+    monkeypatch.setattr(requests.Session, "get", get)
+    return requests_made
+
+
+def _sync(
+    end_date: datetime.date, state: dict[str, Any]
+) -> tuple[dict[tuple[Any, ...], float], dict[str, Any]]:
+    tap = TapECBEchangeRates(
+        config={
+            "currencies": ["USD", "CZK"],
+            "start_date": "2024-02-26",
+            "end_date": end_date.isoformat(),
+        },
+        parse_env_config=False,
+    )
+    stream = tap.streams["exchange_rates"]
+    assert isinstance(stream, ExchangeRatesStream)
+    stream_state = stream.get_context_state(None)
+    stream_state.update(json.loads(json.dumps(state)))
+    records = {
+        (record["date"], record["base_currency"], record["target_currency"]): record[
+            "exchange_rate"
+        ]
+        for record in stream.get_records(None)
+    }
+    return records, dict(stream_state)
+
+
+def test_resume_without_new_rates(requests_made: list[tuple[str, str, str]]) -> None:
+    _, state = _sync(datetime.date(2024, 3, 1), {})
+    requests_made.clear()
+
+    records, new_state = _sync(datetime.date(2024, 3, 3), state)
+
+    # Nothing was published over the weekend, ECB answers 404 and the rates are filled in
+    assert requests_made == [
+        ("USD", "2024-03-02", "2024-03-03"),
+        ("CZK", "2024-03-02", "2024-03-03"),
+    ]
+    assert {date for date, _, _ in records} == {
+        datetime.date(2024, 3, 2),
+        datetime.date(2024, 3, 3),
+    }
+    assert (
+        records[(datetime.date(2024, 3, 3), "EUR", "USD")]
+        == PUBLISHED["USD"][datetime.date(2024, 3, 1)]
+    )
+    assert new_state["last_rates"] == state["last_rates"]
+    assert new_state["end_date"] == "2024-03-03"
+
+
+def test_resume_with_stale_currency(requests_made: list[tuple[str, str, str]]) -> None:
+    _, state = _sync(datetime.date(2024, 3, 1), {})
+    _, state = _sync(datetime.date(2024, 3, 10), state)
+    requests_made.clear()
+
+    records, new_state = _sync(datetime.date(2024, 3, 15), state)
+
+    # USD is fetched after its own last rate only, CZK from before the window starts
+    assert sorted(requests_made) == [
+        ("CZK", "2024-02-25", "2024-03-15"),
+        ("USD", "2024-03-02", "2024-03-15"),
+    ]
+    # Emitting starts a week before the previous end, not after the last USD rate
+    assert min(date for date, _, _ in records) == datetime.date(2024, 3, 3)
+    assert (
+        records[(datetime.date(2024, 3, 15), "EUR", "USD")]
+        == PUBLISHED["USD"][datetime.date(2024, 3, 1)]
+    )
+    assert (
+        records[(datetime.date(2024, 3, 3), "EUR", "CZK")]
+        == PUBLISHED["CZK"][datetime.date(2024, 3, 1)]
+    )
+    assert (
+        records[(datetime.date(2024, 3, 15), "EUR", "CZK")]
+        == PUBLISHED["CZK"][datetime.date(2024, 3, 15)]
+    )
+    assert (datetime.date(2024, 3, 3), "USD", "CZK") in records
+    assert new_state["last_rates"]["USD"] == {
+        "date": "2024-03-01",
+        "rate": PUBLISHED["USD"][datetime.date(2024, 3, 1)],
+    }
+    assert new_state["last_rates"]["CZK"]["date"] == "2024-03-15"